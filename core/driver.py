@@ -11,49 +11,105 @@ Usage:
 """
 
 import asyncio
-from playwright.async_api import async_playwright
+import aiofiles
+import atexit
+from playwright.async_api import async_playwright, TimeoutError as PlaywrightTimeoutError
 import pyautogui
-from PIL import Image
 import os
+import glob
 import time
-import json
+import orjson
 import logging
 from datetime import datetime
-from bs4 import BeautifulSoup, Comment
+from bs4 import BeautifulSoup, Comment, NavigableString
 import re
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import Optional
+from itertools import islice
 import uvicorn
 from urllib.parse import urlparse
 
+# Persist the capture counter every N captures (and on shutdown)
+_COUNTER_SAVE_INTERVAL = 10
+
+# Upper bound on waiting for a page to settle after navigation or interaction
+_SETTLE_TIMEOUT_MS = 2000
+
+# Upper bound on page.goto() reaching DOMContentLoaded
+_NAVIGATION_TIMEOUT_MS = 15000
+
+# Viewport width; screenshots are taken at this CSS width as JPEG so the
+# browser writes them at analysis size with no re-encode in Python
+_VIEWPORT_WIDTH = 1280
+_SCREENSHOT_JPEG_QUALITY = 85
+
+# Capture number in a saved page_NNN.html filename
+_CAPTURE_NUMBER_RE = re.compile(r"page_(\d+)\.html$")
+
+# Characters not allowed in capture directory names
+_UNSAFE_DIR_CHARS_RE = re.compile(r"[^\w\-_.]")
+
+# Tag and keyword sets used while cleaning and analyzing captures
+_NOISE_TAGS = frozenset({"script", "style", "noscript"})
+_CONTAINER_TAGS = frozenset({"div", "section", "article"})
+_ITEM_CHILD_TAGS = frozenset({"a", "span", "p", "h1", "h2", "h3"})
+_PAGINATION_TAGS = frozenset({"a", "button"})
+_CONTAINER_CLASS_KEYWORDS = ("item", "order", "product", "card", "box")
+_PAGINATION_WORDS = ("next", "more", "次", "→")
+
+# Cleaned HTML longer than this (in characters) is truncated before parsing
+_MAX_HTML_LENGTH = 5_000_000
+
+# Comments and script/style/noscript blocks, matched left to right in one scan
+# so a tag inside a comment (or a comment inside a script) is not mistaken for
+# the start of another block
+_NOISE_MARKUP_RE = re.compile(
+    r"<!--.*?-->|<(script|style|noscript)(?=[\s/>])[^>]*>.*?</\1\s*>",
+    re.IGNORECASE | re.DOTALL,
+)
+
+# Text patterns marked with data-claude-* hints in captured HTML
+_PRICE_HINT_RE = re.compile(r"[¥$€£]\d")
+_DATE_HINT_RE = re.compile(r"\d{4}|\w+\s+\d+,\s*\d{4}")
+
+# Workflow guidance attached to API responses; built once and only read
+_WORKFLOW_REMINDER = {
+    "workflow_reminder": [
+        "1. ALWAYS read CLAUDE.md first",
+        "2. Capture page state before extraction",
+        "3. Analyze with tools/page_analyzer.py",
+        "4. Test on small samples first",
+        "5. Save intermediate results frequently",
+    ],
+    "next_steps_after_capture": [
+        "Use Read tool on the HTML file returned",
+        "Run: python tools/page_analyzer.py <html_file>",
+        "Create/use site-specific extractor in sites/",
+        "Validate results before continuing",
+    ],
+    "documentation": "Read CLAUDE.md for complete workflow guide",
+}
+
 
 def get_claude_workflow_reminder():
     """Return workflow guidance for Claude"""
-    return {
-        "workflow_reminder": [
-            "1. ALWAYS read CLAUDE.md first",
-            "2. Capture page state before extraction",
-            "3. Analyze with tools/page_analyzer.py",
-            "4. Test on small samples first",
-            "5. Save intermediate results frequently",
-        ],
-        "next_steps_after_capture": [
-            "Use Read tool on the HTML file returned",
-            "Run: python tools/page_analyzer.py <html_file>",
-            "Create/use site-specific extractor in sites/",
-            "Validate results before continuing",
-        ],
-        "documentation": "Read CLAUDE.md for complete workflow guide",
-    }
+    return _WORKFLOW_REMINDER
 
 
 class BrowserController:
     def __init__(self):
         self.browser = None
+        self.context = None
         self.page = None
         self.playwright = None
-        self.capture_counter = self._load_counter()
+        capture_files = glob.glob("./sessions/*/*/page_*.html")
+        self.capture_counter = self._load_counter(capture_files)
+        self.latest_capture = self._find_latest_capture(capture_files)
+
+        # Counter is flushed every few captures; make sure the last value lands
+        os.makedirs("./tmp", exist_ok=True)
+        atexit.register(self._save_counter)
 
         # Setup session ID that persists throughout browser session
         self.session_id = datetime.now().strftime("%Y-%m-%d_%H-%M")
@@ -71,22 +127,44 @@ class BrowserController:
         self.logger = logging.getLogger(__name__)
         self.session_dir = session_dir
 
-    def _load_counter(self):
-        """Load the persistent capture counter"""
+    def _load_counter(self, capture_files):
+        """Load the persistent capture counter
+
+        The counter is only flushed every few captures, so it is never allowed
+        to fall behind the highest capture number already on disk.
+        """
+        counter = 0
         counter_file = "./tmp/capture_counter.txt"
         try:
             if os.path.exists(counter_file):
                 with open(counter_file, "r") as f:
-                    return int(f.read().strip())
+                    counter = int(f.read().strip())
         except:
             pass
-        return 0
+
+        for path in capture_files:
+            match = _CAPTURE_NUMBER_RE.search(path)
+            if match:
+                counter = max(counter, int(match.group(1)))
+        return counter
+
+    def _find_latest_capture(self, capture_files):
+        """Find the most recent capture left by earlier sessions"""
+        if capture_files:
+            return max(capture_files, key=os.path.getmtime)
+        return None
 
     def _save_counter(self):
-        """Save the capture counter"""
-        os.makedirs("./tmp", exist_ok=True)
-        with open("./tmp/capture_counter.txt", "w") as f:
+        """Save the capture counter
+
+        Written to a temporary file and renamed into place, so a reader never
+        sees a partially written counter.
+        """
+        counter_file = "./tmp/capture_counter.txt"
+        tmp_file = f"{counter_file}.tmp"
+        with open(tmp_file, "w") as f:
             f.write(str(self.capture_counter))
+        os.replace(tmp_file, counter_file)
 
     def _get_base_url(self, url):
         """Extract base URL for directory naming"""
@@ -95,7 +173,7 @@ class BrowserController:
             # Clean domain name for file system
             base_url = parsed.netloc.replace("www.", "").replace(":", "_")
             # Remove any invalid characters for directory names
-            base_url = re.sub(r'[^\w\-_.]', '_', base_url)
+            base_url = _UNSAFE_DIR_CHARS_RE.sub("_", base_url)
             return base_url if base_url else "unknown"
         except Exception:
             return "unknown"
@@ -112,19 +190,18 @@ class BrowserController:
             ],
         )
 
-        # Create context with user agent
-        context = await self.browser.new_context(
-            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-        )
-        
-        self.page = await context.new_page()
-
         # Get screen dimensions and set to full height
         screen_size = pyautogui.size()
-        await self.page.set_viewport_size(
-            {"width": 1280, "height": screen_size.height - 100}
+
+        # Create one context with user agent and viewport; it is kept for the
+        # whole session so any page opened in it shares cookies and settings
+        self.context = await self.browser.new_context(
+            user_agent="Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            viewport={"width": _VIEWPORT_WIDTH, "height": screen_size.height - 100},
         )
 
+        self.page = await self.context.new_page()
+
         self.logger.info("Browser started successfully")
 
     async def capture_state(self):
@@ -133,11 +210,14 @@ class BrowserController:
             raise Exception("Browser not started")
 
         self.capture_counter += 1
-        self._save_counter()
+        if self.capture_counter % _COUNTER_SAVE_INTERVAL == 0:
+            self._save_counter()
 
-        # Get page info
+        # Get page info and HTML content in concurrent round-trips
         url = self.page.url
-        title = await self.page.title()
+        title, html_content = await asyncio.gather(
+            self.page.title(), self.page.content()
+        )
         timestamp = time.time()
 
         # Create session directory structure based on URL
@@ -147,27 +227,28 @@ class BrowserController:
 
         # Create filenames within session/base_url directory
         html_file = f"{capture_dir}/page_{self.capture_counter:03d}.html"
-        screenshot_file = f"{capture_dir}/screenshot_{self.capture_counter:03d}.png"
+        screenshot_file = f"{capture_dir}/screenshot_{self.capture_counter:03d}.jpg"
         analysis_file = f"{capture_dir}/page_{self.capture_counter:03d}_analysis.json"
 
-        # Get HTML content
-        html_content = await self.page.content()
-
-        # Clean HTML for analysis while preserving structure
-        cleaned_html = self._clean_html_for_analysis(html_content)
-
-        # Save HTML
-        with open(html_file, "w", encoding="utf-8") as f:
-            f.write(cleaned_html)
-
-        # Take screenshot and optimize
-        await self.page.screenshot(path=screenshot_file, full_page=True)
-        self._optimize_screenshot(screenshot_file)
+        # Clean HTML for analysis while preserving structure; hints, counts
+        # and selector suggestions are collected in the same pass. Parsing is
+        # CPU-bound, so it runs in a worker thread to keep the API responsive
+        cleaned_html, page_stats = await asyncio.to_thread(
+            self._clean_html_for_analysis, html_content
+        )
 
         # Generate analysis hints for Claude
-        analysis = self._analyze_page_structure(cleaned_html, url, title)
-        with open(analysis_file, "w", encoding="utf-8") as f:
-            json.dump(analysis, f, indent=2, ensure_ascii=False)
+        analysis = self._analyze_page_structure(page_stats, url, title)
+
+        # Save HTML and analysis while the screenshot is taken
+        await asyncio.gather(
+            self._write_file(html_file, cleaned_html.encode("utf-8")),
+            self._write_file(
+                analysis_file, orjson.dumps(analysis, option=orjson.OPT_INDENT_2)
+            ),
+            self._take_screenshot(screenshot_file),
+        )
+        self.latest_capture = html_file
 
         self.logger.info(f"Captured: {html_file}, {screenshot_file}")
 
@@ -186,70 +267,129 @@ class BrowserController:
 
         return result
 
+    async def _write_file(self, path, data):
+        """Write bytes to a file without blocking the event loop"""
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(data)
+
+    async def _take_screenshot(self, screenshot_file):
+        """Take a full-page screenshot at CSS pixel size as a compressed JPEG"""
+        await self.page.screenshot(
+            path=screenshot_file,
+            full_page=True,
+            type="jpeg",
+            quality=_SCREENSHOT_JPEG_QUALITY,
+            scale="css",
+        )
+
     def _clean_html_for_analysis(self, html_content):
         """Clean HTML while preserving structure for extraction"""
-        soup = BeautifulSoup(html_content, "html.parser")
+        # Drop script/style/noscript blocks and comments from the markup so the
+        # parser never builds them; the tree passes below catch anything left
+        html_content = _NOISE_MARKUP_RE.sub("", html_content)
+
+        # Bound parse time and memory on giant pages; cut at a tag boundary and
+        # let the parser close whatever is left open
+        if len(html_content) > _MAX_HTML_LENGTH:
+            cut = html_content.rfind("</", 0, _MAX_HTML_LENGTH)
+            if cut <= 0:
+                cut = _MAX_HTML_LENGTH
+            self.logger.warning(
+                f"HTML truncated for analysis: {len(html_content)} -> {cut} characters"
+            )
+            html_content = html_content[:cut]
+
+        soup = BeautifulSoup(html_content, "lxml")
 
         # Remove noise but keep data attributes
-        for element in soup(["script", "style", "noscript"]):
+        for element in soup(_NOISE_TAGS):
             element.decompose()
 
         # Remove comments
         for comment in soup.find_all(string=lambda text: isinstance(text, Comment)):
             comment.extract()
 
-        # Add analysis hints
-        self._add_analysis_hints(soup)
+        page_stats = self._annotate_and_analyze(soup)
 
-        return str(soup)
+        return str(soup), page_stats
 
-    def _add_analysis_hints(self, soup):
-        """Add data attributes to help Claude identify patterns"""
-        # Mark potential containers
-        for elem in soup.find_all(["div", "section", "article"]):
-            children = elem.find_all(["a", "span", "p", "h1", "h2", "h3"])
-            if len(children) > 3:
-                elem["data-claude-container"] = "potential-item"
+    def _annotate_and_analyze(self, soup):
+        """Add data attributes to help Claude identify patterns, collecting
+        page structure, detected patterns and selector suggestions in the
+        same walk"""
+        structure = {
+            "total_elements": 0,
+            "containers": 0,
+            "links": 0,
+            "forms": 0,
+            "tables": 0,
+        }
+        detected = {
+            "potential_items": 0,
+            "prices_detected": 0,
+            "dates_detected": 0,
+        }
+        container_classes = []
+        pagination_selectors = []
 
-        # Mark prices
-        for elem in soup.find_all(string=re.compile(r"[¥$€£]\d")):
-            if elem.parent:
-                elem.parent["data-claude-price"] = "detected"
+        for elem in soup.descendants:
+            if isinstance(elem, NavigableString):
+                # Mark prices and dates on the element holding the text
+                parent = elem.parent
+                if not parent:
+                    continue
+                if _PRICE_HINT_RE.search(elem) and "data-claude-price" not in parent.attrs:
+                    parent["data-claude-price"] = "detected"
+                    detected["prices_detected"] += 1
+                if _DATE_HINT_RE.search(elem) and "data-claude-date" not in parent.attrs:
+                    parent["data-claude-date"] = "detected"
+                    detected["dates_detected"] += 1
+                continue
+
+            name = elem.name
+            structure["total_elements"] += 1
+            if name in _CONTAINER_TAGS:
+                structure["containers"] += 1
+                # Mark potential containers; only need to know there are more than 3
+                children = elem.find_all(_ITEM_CHILD_TAGS, limit=4)
+                if len(children) > 3:
+                    elem["data-claude-container"] = "potential-item"
+                    detected["potential_items"] += 1
+                if name == "div":
+                    self._collect_container_classes(elem, container_classes)
+            elif name == "form":
+                structure["forms"] += 1
+            elif name == "table":
+                structure["tables"] += 1
+            if name == "a":
+                structure["links"] += 1
+            if name in _PAGINATION_TAGS:
+                self._collect_pagination_selector(elem, pagination_selectors)
+
+        # dict.fromkeys dedups in document order, so suggestions are stable
+        suggestions = {}
+        if container_classes:
+            suggestions["containers"] = list(islice(dict.fromkeys(container_classes), 5))
+        if pagination_selectors:
+            suggestions["pagination"] = list(islice(dict.fromkeys(pagination_selectors), 3))
 
-        # Mark dates
-        for elem in soup.find_all(string=re.compile(r"\d{4}|\w+\s+\d+,\s*\d{4}")):
-            if elem.parent:
-                elem.parent["data-claude-date"] = "detected"
+        return {
+            "structure": structure,
+            "detected_patterns": detected,
+            "suggested_selectors": suggestions,
+        }
 
-    def _analyze_page_structure(self, html_content, url, title):
+    def _analyze_page_structure(self, page_stats, url, title):
         """Generate analysis for Claude"""
-        soup = BeautifulSoup(html_content, "html.parser")
-
         analysis = {
             "page_info": {
                 "url": url,
                 "title": title,
                 "timestamp": datetime.now().isoformat(),
             },
-            "structure": {
-                "total_elements": len(soup.find_all()),
-                "containers": len(soup.find_all(["div", "section", "article"])),
-                "links": len(soup.find_all("a")),
-                "forms": len(soup.find_all("form")),
-                "tables": len(soup.find_all("table")),
-            },
-            "detected_patterns": {
-                "potential_items": len(
-                    soup.find_all(attrs={"data-claude-container": "potential-item"})
-                ),
-                "prices_detected": len(
-                    soup.find_all(attrs={"data-claude-price": "detected"})
-                ),
-                "dates_detected": len(
-                    soup.find_all(attrs={"data-claude-date": "detected"})
-                ),
-            },
-            "suggested_selectors": self._suggest_selectors(soup),
+            "structure": page_stats["structure"],
+            "detected_patterns": page_stats["detected_patterns"],
+            "suggested_selectors": page_stats["suggested_selectors"],
             "claude_hints": [
                 "Use tools/page_analyzer.py for detailed analysis",
                 "Look for repeated patterns in containers",
@@ -260,49 +400,19 @@ class BrowserController:
 
         return analysis
 
-    def _suggest_selectors(self, soup):
-        """Suggest likely selectors for common patterns"""
-        suggestions = {}
-
-        # Common container patterns
-        container_classes = []
-        for elem in soup.find_all("div", class_=True):
-            classes = elem.get("class", [])
-            for cls in classes:
-                if any(
-                    keyword in cls.lower()
-                    for keyword in ["item", "order", "product", "card", "box"]
-                ):
-                    container_classes.append(f".{cls}")
-
-        if container_classes:
-            suggestions["containers"] = list(set(container_classes[:5]))
-
-        # Pagination patterns
-        pagination_selectors = []
-        for elem in soup.find_all(["a", "button"]):
-            text = elem.get_text().strip().lower()
-            if any(word in text for word in ["next", "more", "次", "→"]):
-                if elem.get("class"):
-                    pagination_selectors.append(f".{' '.join(elem['class'])}")
-
-        if pagination_selectors:
-            suggestions["pagination"] = list(set(pagination_selectors[:3]))
+    def _collect_container_classes(self, elem, container_classes):
+        """Collect class selectors from a div that look like common containers"""
+        for cls in elem.get("class", []):
+            cls_lower = cls.lower()
+            if any(keyword in cls_lower for keyword in _CONTAINER_CLASS_KEYWORDS):
+                container_classes.append(f".{cls}")
 
-        return suggestions
-
-    def _optimize_screenshot(self, screenshot_path):
-        """Optimize screenshot for Claude analysis"""
-        try:
-            with Image.open(screenshot_path) as img:
-                # Resize to reasonable width for analysis
-                if img.width > 1280:
-                    ratio = 1280 / img.width
-                    new_height = int(img.height * ratio)
-                    img = img.resize((1280, new_height), Image.Resampling.LANCZOS)
-                    img.save(screenshot_path, optimize=True, quality=85)
-        except Exception as e:
-            self.logger.warning(f"Screenshot optimization failed: {e}")
+    def _collect_pagination_selector(self, elem, pagination_selectors):
+        """Collect the class selector of a link or button that looks like pagination"""
+        text = elem.get_text().strip().lower()
+        if any(word in text for word in _PAGINATION_WORDS):
+            if elem.get("class"):
+                pagination_selectors.append(f".{' '.join(elem['class'])}")
 
     async def navigate_to(self, url, wait_load=True):
         """Navigate to URL with smart waiting"""
@@ -310,13 +420,14 @@ class BrowserController:
             await self.start_browser()
 
         try:
+            await self.page.goto(url, wait_until="domcontentloaded", timeout=_NAVIGATION_TIMEOUT_MS)
+
             if wait_load:
-                await self.page.goto(url, wait_until="networkidle", timeout=30000)
+                # Give dynamic content a moment, but stop as soon as the network is quiet
+                await self._wait_for_settle()
             else:
-                await self.page.goto(url, timeout=30000)
-
-            # Wait a bit for dynamic content
-            await asyncio.sleep(2)
+                # Still give images and scripts a bounded chance to finish loading
+                await self._wait_for_settle(state="load")
 
             self.logger.info(f"Navigated to: {url}")
             return {"status": "success", "url": url, "title": await self.page.title()}
@@ -324,6 +435,33 @@ class BrowserController:
             self.logger.error(f"Navigation failed: {e}")
             raise Exception(f"Navigation failed: {e}")
 
+    async def _wait_for_settle(self, timeout=_SETTLE_TIMEOUT_MS, state="networkidle"):
+        """Wait until the page reaches the given load state, for at most timeout ms"""
+        try:
+            await self.page.wait_for_load_state(state, timeout=timeout)
+        except PlaywrightTimeoutError:
+            # Pages with constant background traffic never go idle; carry on
+            pass
+
+    async def _perform_and_settle(self, action):
+        """Run an interaction and wait for whatever it started to settle
+
+        If the interaction starts a navigation, wait for the new page as
+        navigate_to does. Otherwise give in-place updates up to
+        _SETTLE_TIMEOUT_MS, the same bound as the old fixed sleep.
+        """
+        performed = False
+        try:
+            async with self.page.expect_navigation(wait_until="commit", timeout=_SETTLE_TIMEOUT_MS):
+                await action()
+                performed = True
+        except PlaywrightTimeoutError:
+            if not performed:
+                raise
+            # No navigation: waiting for one already spent the bounded fallback wait
+            return
+        await self._wait_for_settle()
+
     async def click_element(self, selector, wait_for_load=True):
         """Click an element by CSS selector"""
         if not self.page:
@@ -334,11 +472,11 @@ class BrowserController:
             await self.page.wait_for_selector(selector, timeout=10000)
             
             # Click the element
-            await self.page.click(selector)
-            
             if wait_for_load:
-                # Wait a moment for any dynamic content to load
-                await asyncio.sleep(2)
+                # Wait for any navigation or dynamic content the click started
+                await self._perform_and_settle(lambda: self.page.click(selector))
+            else:
+                await self.page.click(selector)
             
             self.logger.info(f"Clicked element: {selector}")
             return {"status": "success", "selector": selector}
@@ -356,11 +494,8 @@ class BrowserController:
             # Wait for select element
             await self.page.wait_for_selector(selector, timeout=10000)
             
-            # Select the option
-            await self.page.select_option(selector, value)
-            
-            # Wait for page to update
-            await asyncio.sleep(2)
+            # Select the option and wait for page to update
+            await self._perform_and_settle(lambda: self.page.select_option(selector, value))
             
             self.logger.info(f"Selected option {value} from {selector}")
             return {"status": "success", "selector": selector, "value": value}
@@ -371,10 +506,13 @@ class BrowserController:
 
     async def close(self):
         """Clean up browser resources"""
+        if self.context:
+            await self.context.close()
         if self.browser:
             await self.browser.close()
         if self.playwright:
             await self.playwright.stop()
+        self._save_counter()
         self.logger.info("Browser closed")
 
 
@@ -391,6 +529,8 @@ controller = BrowserController()
 
 class NavigateRequest(BaseModel):
     url: str
+    # True waits for network idle, False only for the load event; both are
+    # bounded by _SETTLE_TIMEOUT_MS after DOMContentLoaded
     wait_load: Optional[bool] = True
 
 class ClickRequest(BaseModel):
@@ -433,20 +573,12 @@ async def get_status():
         except:
             pass
 
-    # Find latest captures from sessions directory
-    import glob
-
-    html_files = glob.glob("./sessions/*/*/page_*.html")
-    latest_capture = None
-    if html_files:
-        latest_capture = max(html_files, key=os.path.getmtime)
-
     return {
         "status": "ready" if controller.page else "not_initialized",
         "url": current_url,
         "title": current_title,
         "capture_count": controller.capture_counter,
-        "latest_capture": latest_capture,
+        "latest_capture": controller.latest_capture,
         "session_dir": controller.session_dir,
         **get_claude_workflow_reminder(),
     }
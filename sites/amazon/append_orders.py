@@ -1,24 +1,28 @@
-import json
+import orjson
 import csv
 
 # Load extracted orders
-with open('outputs/orders.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+with open('outputs/orders.json', 'rb') as f:
+    data = orjson.loads(f.read())
 
 orders = data['orders']
 
-# Load existing CSV
-existing_orders = []
+# Load existing order IDs, streaming the CSV instead of keeping every row
+existing_ids = set()
+existing_count = 0
 try:
     with open('outputs/amazon_orders_2024_formatted.csv', 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        existing_orders = list(reader)
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header:
+            order_idx = header.index('Order#')
+            for row in reader:
+                if row:  # DictReader skipped blank lines too
+                    existing_ids.add(row[order_idx])
+                    existing_count += 1
 except FileNotFoundError:
     pass
 
-# Get existing order IDs
-existing_ids = {row['Order#'] for row in existing_orders}
-
 # Convert new orders to CSV format
 new_orders = []
 for order in orders:
@@ -33,7 +37,7 @@ for order in orders:
             product = product[:67] + '...'
         
         new_orders.append({
-            'No.': len(existing_orders) + len(new_orders) + 1,
+            'No.': existing_count + len(new_orders) + 1,
             'Order#': order_id,
             'Date': order.get('order_date', 'N/A'),
             'Price': price,
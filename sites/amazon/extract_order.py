@@ -3,13 +3,77 @@
 Extract first order details from Amazon orders page HTML
 """
 
-from bs4 import BeautifulSoup
-import json
+from bs4 import BeautifulSoup, NavigableString, SoupStrainer, builder_registry
+import orjson
 import re
 import os
 import glob
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
+# Only these subtrees are consulted: order containers (div), product links (a),
+# the page title, and <main> for the debug summary
+_ORDER_PAGE_STRAINER = SoupStrainer(['div', 'a', 'title', 'main'])
+# One tree builder per process, reused for every page (extract_many runs pages
+# in separate processes, never concurrently in one)
+_LXML_BUILDER = builder_registry.lookup('lxml')()
+
+# Patterns are compiled once here; extract_order_from_container runs per container
+_CONTAINER_PATTERNS = [
+    {'class': re.compile(r'order', re.I)},
+    {'data-order-id': True},
+    {'class': re.compile(r'a-box-group')},
+    {'class': re.compile(r'shipment', re.I)},
+    {'id': re.compile(r'order|OrderID', re.I)},
+]
+
+_ORDER_INDICATORS = (
+    r'Order.*#[\d-]+',
+    r'注文番号.*[\d-]+',
+    r'Delivered.*\d{4}',
+    r'¥[\d,]+.*total',
+    r'Order placed.*\d{4}',
+    r'Shipped.*\d{4}',
+)
+_ORDER_INDICATOR_RES = [re.compile(p, re.I) for p in _ORDER_INDICATORS]
+# Union of all indicators, so most strings are rejected by a single search
+_ANY_ORDER_INDICATOR_RE = re.compile('|'.join(f'(?:{p})' for p in _ORDER_INDICATORS), re.I)
+
+# Scoring and status keywords are matched against lowercased container text
+_SCORE_KEYWORDS = ['order', '注文', '¥', 'delivered', 'shipped', 'placed', '#']
+_STATUS_KEYWORDS = ['delivered', 'shipped', 'processing', 'cancelled', '配送済み', '発送済み', 'お届け済み', 'pending']
+
+_ORDER_ID_RES = [re.compile(p, re.I) for p in (
+    r'Order.*?#[\s]*([A-Z0-9-]+)',
+    r'注文番号.*?([A-Z0-9-]+)',
+    r'Order ID.*?([A-Z0-9-]+)',
+    r'#([0-9-]+)',
+)]
+
+# (pattern, True if the date is in group 1 rather than the whole match)
+_DATE_RES = [(re.compile(p, re.I), 'placed' in p.lower()) for p in (
+    r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',
+    r'\d{4}年\d{1,2}月\d{1,2}日',
+    r'\d{1,2}/\d{1,2}/\d{4}',
+    r'Order placed\s+([^\n]+)',
+    r'Placed on\s+([^\n]+)',
+)]
+
+_TOTAL_RES = [re.compile(p, re.I) for p in (
+    r'Order total:?\s*¥([\d,]+)',
+    r'Total:?\s*¥([\d,]+)',
+    r'¥([\d,]+)\s*total',
+)]
+
+_PRICE_RE = re.compile(r'¥[\d,]+')
+_PRODUCT_HREF_RE = re.compile(r'/dp/|/gp/product|amazon\.co\.jp.*product')
+_NAV_WORDS = frozenset({'see', 'view', 'details', 'more', 'track', 'return', 'buy', 'again', 'reorder'})
+_DELIVER_TO_RE = re.compile(r'deliver(ed)?\s+to[:\s]*([^\n]+)', re.I)
+
+def _price_value(price):
+    """Numeric value of a '¥1,234' price string"""
+    return float(price[1:].replace(',', ''))
+
 def find_latest_html_file(tmp_dir):
     """Find the latest HTML file in the tmp directory based on modification time"""
     html_pattern = os.path.join(tmp_dir, "page_*.html")
@@ -35,7 +99,7 @@ def extract_all_order_details(html_file_path):
     except FileNotFoundError:
         return {"error": f"File not found: {html_file_path}"}
     
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = BeautifulSoup(html_content, builder=_LXML_BUILDER, parse_only=_ORDER_PAGE_STRAINER)
     
     # Debug: Get page title first
     title = soup.find('title')
@@ -43,43 +107,44 @@ def extract_all_order_details(html_file_path):
     
     result = {"page_title": page_title}
     
-    # Find all potential order containers using multiple strategies
-    all_containers = set()
+    # Find all potential order containers using multiple strategies.
+    # Keyed by id(): bs4 hashes a Tag by serializing its whole subtree
+    all_containers = {}
     
     # Strategy 1: Look for order-specific class patterns
-    patterns = [
-        {'class': re.compile(r'order', re.I)},
-        {'data-order-id': True},
-        {'class': re.compile(r'a-box-group')},
-        {'class': re.compile(r'shipment', re.I)},
-        {'id': re.compile(r'order|OrderID', re.I)},
-    ]
-    
-    for pattern in patterns:
+    for pattern in _CONTAINER_PATTERNS:
         containers = soup.find_all('div', pattern)
-        all_containers.update(containers)
+        all_containers.update((id(c), c) for c in containers)
     
     # Strategy 2: Look for text containing order indicators and get parent containers
-    order_indicators = [
-        r'Order.*#[\d-]+',
-        r'注文番号.*[\d-]+', 
-        r'Delivered.*\d{4}',
-        r'¥[\d,]+.*total',
-        r'Order placed.*\d{4}',
-        r'Shipped.*\d{4}'
-    ]
+    # Matched strings share ancestors, so each div's text length is computed once
+    text_lengths = {}
     
-    for indicator in order_indicators:
-        text_elements = soup.find_all(string=re.compile(indicator, re.I))
+    def text_length(elem):
+        key = id(elem)
+        if key not in text_lengths:
+            text_lengths[key] = len(elem.get_text())
+        return text_lengths[key]
+    
+    # One walk over the strings; matches are grouped per indicator so containers
+    # are still collected in indicator order
+    text_elements_by_indicator = [[] for _ in _ORDER_INDICATOR_RES]
+    for elem in soup.descendants:
+        if isinstance(elem, NavigableString) and _ANY_ORDER_INDICATOR_RE.search(elem):
+            for text_elements, indicator in zip(text_elements_by_indicator, _ORDER_INDICATOR_RES):
+                if indicator.search(elem):
+                    text_elements.append(elem)
+    
+    for text_elements in text_elements_by_indicator:
         for elem in text_elements:
             # Get the container that likely holds the full order
             container = elem.find_parent('div')
-            while container and len(container.get_text()) < 200:  # Find substantial container
+            while container and text_length(container) < 200:  # Find substantial container
                 container = container.find_parent('div')
             if container:
-                all_containers.add(container)
+                all_containers[id(container)] = container
     
-    order_containers = list(all_containers)
+    order_containers = list(all_containers.values())
     result['containers_found'] = len(order_containers)
     
     # Process all containers to extract order details
@@ -93,27 +158,18 @@ def extract_all_order_details(html_file_path):
             
         order = {}
         
+        text_lower = text.lower()
+        
         # Score container to see if it's likely an order
-        score = 0
-        order_keywords = ['order', '注文', '¥', 'delivered', 'shipped', 'placed', '#']
-        for keyword in order_keywords:
-            if keyword.lower() in text.lower():
-                score += 1
+        score = sum(1 for keyword in _SCORE_KEYWORDS if keyword in text_lower)
         
         # Must have some order indicators to be considered
         if score < 2:
             return None
         
         # Extract order ID
-        order_id_patterns = [
-            r'Order.*?#[\s]*([A-Z0-9-]+)',
-            r'注文番号.*?([A-Z0-9-]+)', 
-            r'Order ID.*?([A-Z0-9-]+)',
-            r'#([0-9-]+)',
-        ]
-        
-        for pattern in order_id_patterns:
-            match = re.search(pattern, text, re.I)
+        for pattern in _ORDER_ID_RES:
+            match = pattern.search(text)
             if match:
                 order['order_id'] = match.group(1)
                 break
@@ -123,40 +179,26 @@ def extract_all_order_details(html_file_path):
             return None
             
         # Extract order date
-        date_patterns = [
-            r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',
-            r'\d{4}年\d{1,2}月\d{1,2}日',
-            r'\d{1,2}/\d{1,2}/\d{4}',
-            r'Order placed\s+([^\n]+)',
-            r'Placed on\s+([^\n]+)',
-        ]
-        
-        for pattern in date_patterns:
-            match = re.search(pattern, text, re.I)
+        for pattern, date_in_group in _DATE_RES:
+            match = pattern.search(text)
             if match:
-                order['order_date'] = match.group(1) if 'placed' in pattern.lower() else match.group(0)
+                order['order_date'] = match.group(1) if date_in_group else match.group(0)
                 break
         
         # Extract total amount
-        total_patterns = [
-            r'Order total:?\s*¥([\d,]+)',
-            r'Total:?\s*¥([\d,]+)', 
-            r'¥([\d,]+)\s*total',
-        ]
-        
-        for pattern in total_patterns:
-            match = re.search(pattern, text, re.I)
+        for pattern in _TOTAL_RES:
+            match = pattern.search(text)
             if match:
                 order['total_amount'] = f"¥{match.group(1)}"
                 break
         
         # Extract all prices found (but filter out unrealistic ones)
-        price_matches = re.findall(r'¥[\d,]+', text)
+        price_matches = _PRICE_RE.findall(text)
         if price_matches:
             # Remove prices that are too large or likely page artifacts
             filtered_prices = []
             for price in price_matches:
-                price_value = float(price.replace('¥', '').replace(',', ''))
+                price_value = _price_value(price)
                 # Keep prices between ¥1 and ¥1,000,000 (reasonable range)
                 if 1 <= price_value <= 1000000:
                     filtered_prices.append(price)
@@ -165,24 +207,23 @@ def extract_all_order_details(html_file_path):
                 order['all_prices'] = filtered_prices[:5]  # Limit to first 5 reasonable prices
         
         # Extract delivery status
-        status_keywords = ['delivered', 'shipped', 'processing', 'cancelled', '配送済み', '発送済み', 'お届け済み', 'pending']
-        for keyword in status_keywords:
-            if keyword.lower() in text.lower():
+        for keyword in _STATUS_KEYWORDS:
+            if keyword in text_lower:
                 order['status'] = keyword
                 break
         
         # Extract products
-        product_links = container.find_all('a', href=re.compile(r'/dp/|/gp/product|amazon\.co\.jp.*product'))
+        product_links = container.find_all('a', href=_PRODUCT_HREF_RE)
         products = []
         seen_products = set()  # Avoid duplicate products
         
         for link in product_links:
-            product_text = link.get_text().strip()
+            # .string avoids flattening the subtree for single-text anchors
+            product_text = (link.string or link.get_text()).strip()
             # Filter out navigation links and short text
-            if (product_text and 
-                len(product_text) > 15 and 
+            if (len(product_text) > 15 and 
                 product_text not in seen_products and
-                not re.match(r'^(see|view|details|more|track|return|buy|again|reorder)$', product_text, re.I)):
+                product_text.lower() not in _NAV_WORDS):
                 products.append(product_text)
                 seen_products.add(product_text)
         
@@ -190,10 +231,9 @@ def extract_all_order_details(html_file_path):
             order['products'] = products[:3]  # Limit to first 3 unique products
         
         # Extract delivery address info if present
-        if re.search(r'deliver(ed)?\s+to', text, re.I):
-            delivery_match = re.search(r'deliver(ed)?\s+to[:\s]*([^\n]+)', text, re.I)
-            if delivery_match:
-                order['delivery_info'] = delivery_match.group(2).strip()
+        delivery_match = _DELIVER_TO_RE.search(text)
+        if delivery_match:
+            order['delivery_info'] = delivery_match.group(2).strip()
         
         return order
     
@@ -223,12 +263,16 @@ def extract_all_order_details(html_file_path):
                     if 'status' in order and 'status' not in existing_order:
                         existing_order['status'] = order['status']
                     
-                    # Merge all prices (remove duplicates)
+                    # Merge all prices, keyed by value so each is parsed once;
+                    # sorted into all_prices after the last container
                     if 'all_prices' in order:
-                        existing_prices = set(existing_order.get('all_prices', []))
-                        new_prices = set(order.get('all_prices', []))
-                        combined_prices = list(existing_prices.union(new_prices))
-                        existing_order['all_prices'] = sorted(combined_prices, key=lambda x: float(x.replace('¥', '').replace(',', '')))
+                        if '_prices_by_value' not in existing_order:
+                            existing_order['_prices_by_value'] = {
+                                _price_value(p): p for p in existing_order.get('all_prices', [])
+                            }
+                        existing_order['_prices_by_value'].update(
+                            {_price_value(p): p for p in order['all_prices']}
+                        )
                     
                     # Update delivery info if available
                     if 'delivery_info' in order and 'delivery_info' not in existing_order:
@@ -236,6 +280,10 @@ def extract_all_order_details(html_file_path):
         
         # Convert back to list and sort by date (newest first)
         all_orders = list(orders_dict.values())
+        for order in all_orders:
+            if '_prices_by_value' in order:
+                prices_by_value = order.pop('_prices_by_value')
+                order['all_prices'] = [prices_by_value[value] for value in sorted(prices_by_value)]
         all_orders.sort(key=lambda x: x.get('order_date', ''), reverse=True)
         
         result['total_orders_found'] = len(all_orders)
@@ -249,15 +297,30 @@ def extract_all_order_details(html_file_path):
     
     else:
         # No containers found - debug the page structure
+        all_divs = soup.find_all('div')
+        body_text = soup.get_text()
         result['debug_info'] = {
-            'total_divs': len(soup.find_all('div')),
-            'body_text_sample': soup.get_text()[:500] + "..." if len(soup.get_text()) > 500 else soup.get_text(),
+            'total_divs': len(all_divs),
+            'body_text_sample': body_text[:500] + "..." if len(body_text) > 500 else body_text,
             'has_main': bool(soup.find('main')),
-            'div_classes': [div.get('class') for div in soup.find_all('div')[:10] if div.get('class')]
+            'div_classes': [div.get('class') for div in all_divs[:10] if div.get('class')]
         }
     
     return result
 
+def extract_many(html_file_paths):
+    """Extract order details from several captured pages in parallel
+
+    Each page is parsed in its own process, so results come back in the
+    same order as html_file_paths.
+    """
+    html_file_paths = list(html_file_paths)
+    if len(html_file_paths) <= 1:
+        return [extract_all_order_details(path) for path in html_file_paths]
+    
+    with ProcessPoolExecutor() as executor:
+        return list(executor.map(extract_all_order_details, html_file_paths))
+
 def main():
     tmp_dir = '../../tmp'
     output_file = 'outputs/orders.json'
@@ -276,8 +339,8 @@ def main():
         return
     
     # Save to JSON file
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(result, f, indent=2, ensure_ascii=False)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
     
     print(f"✅ Extraction complete!")
     print(f"📊 Total containers analyzed: {result.get('containers_found', 0)}")
@@ -20,66 +20,135 @@ CLAUDE: Always test on small samples first, then scale up!
 """
 
 import os
-import json
+import orjson
 import csv
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, Comment, NavigableString, builder_registry
+import soupsieve as sv
+from lxml import etree
+import lxml.html
 import re
-import glob
+
+# TODO: CLAUDE - Customize this selector based on your page analysis
+CONTAINER_SELECTOR = "div"  # Change this to your actual container selector
+# Compiled once; both extraction functions reuse it
+_CONTAINER_MATCHER = sv.compile(CONTAINER_SELECTOR)
+# Tree builders are created once per process and reused by every parse;
+# like the soups they build, they are not meant to be shared across threads
+_LXML_BUILDER = builder_registry.lookup('lxml')()
+_FRAGMENT_BUILDER = builder_registry.lookup('html.parser')()
+# TODO: CLAUDE - Adjust the title selector (keep _TITLE_XPATH in step)
+_TITLE_MATCHER = sv.compile('h1, h2, h3, .title, .name')
+
+# Field patterns, compiled once and shared with the XPath fast path
+# TODO: CLAUDE - adjust these together with extract_item_from_container()
+_ID_TEXT_PATTERN = r'ID.*\d+'
+_PRICE_PATTERN = r'[¥$€£]\d+'
+_DATE_PATTERN = r'\d{4}-\d{2}-\d{2}|\w+ \d+, \d{4}'
+_ID_TEXT_RE = re.compile(_ID_TEXT_PATTERN)
+_ID_NUM_RE = re.compile(r'\d+')
+_PRICE_RE = re.compile(_PRICE_PATTERN)
+_DATE_RE = re.compile(_DATE_PATTERN)
+# Union of the text patterns, so most strings are rejected by a single search
+_ANY_FIELD_RE = re.compile('|'.join(f'(?:{p})' for p in (_ID_TEXT_PATTERN, _PRICE_PATTERN, _DATE_PATTERN)))
+
+# Compiled XPath for extract_all_data_fast()
+# TODO: CLAUDE - keep these in step with CONTAINER_SELECTOR and
+# extract_item_from_container() when you customize them
+CONTAINER_XPATH = etree.XPath("//div")  # Same containers as CONTAINER_SELECTOR = "div"
+CONTAINER_TAG = "div"  # Tag streamed by extract_all_data_stream()
+_ID_ATTR_XPATH = etree.XPath("(.//*[@data-id])[1]/@data-id")
+_TITLE_XPATH = etree.XPath(
+    "(.//*[self::h1 or self::h2 or self::h3"
+    " or contains(concat(' ', normalize-space(@class), ' '), ' title ')"
+    " or contains(concat(' ', normalize-space(@class), ' '), ' name ')])[1]")
+# Text nodes are matched in Python, one walk for all text fields
+_TEXT_NODES_XPATH = etree.XPath(".//text()")
+_URL_XPATH = etree.XPath("(.//a[@href])[1]/@href")
+# Same result as HtmlElement.text_content(), but also works on plain etree elements
+_TEXT_XPATH = etree.XPath("string()")
+
+
+def is_stream_container(element):
+    """
+    CLAUDE: Narrow CONTAINER_TAG down to your containers here, e.g.
+    'item-container' in (element.get('class') or '').split()
+    """
+    return True
+
+
+def _newest_entry(directory, prefix="", recursive=False):
+    """
+    Return (mtime, path) of the newest prefix*.html file in directory, or None.
+    With recursive=True, subdirectories are scanned too, in the same pass.
+    """
+    newest = None
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("."):
+                    continue
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    candidate = _newest_entry(entry.path, prefix, recursive)
+                elif (name.startswith(prefix) and name.endswith(".html")
+                        and entry.is_file()):
+                    candidate = (entry.stat().st_mtime, entry.path)
+                else:
+                    continue
+                if candidate and (newest is None or candidate[0] > newest[0]):
+                    newest = candidate
+    except FileNotFoundError:
+        pass
+    return newest
 
 
 def find_latest_html_file(search_dir="../tmp"):
     """Find the latest HTML file for extraction"""
-    html_pattern = os.path.join(search_dir, "page_*.html")
-    html_files = glob.glob(html_pattern)
-    
-    if not html_files:
-        # Try sessions directory
-        sessions_files = []
-        if os.path.exists("../sessions"):
-            for session_dir in os.listdir("../sessions"):
-                session_path = os.path.join("../sessions", session_dir)
-                if os.path.isdir(session_path):
-                    session_pattern = os.path.join(session_path, "*.html")
-                    session_files = glob.glob(session_pattern)
-                    sessions_files.extend(session_files)
+    newest = _newest_entry(search_dir, prefix="page_")
+    
+    if newest is None:
+        # Try sessions directory; captures live in sessions/<session>/<site>/
+        newest = _newest_entry("../sessions", recursive=True)
         
-        if sessions_files:
-            html_files = sessions_files
-        else:
+        if newest is None:
             raise FileNotFoundError(f"No HTML files found in {search_dir} or ../sessions/")
     
-    # Sort by modification time (newest first)
-    latest_file = max(html_files, key=lambda x: os.path.getmtime(x))
+    # Newest by modification time, found while scanning
+    latest_file = newest[1]
     print(f"📄 Using latest HTML file: {os.path.basename(latest_file)}")
     
     return latest_file
 
 
-def extract_sample_data(html_file, limit=3):
+def load_soup(html_file):
+    """
+    Parse a captured page once, so sample and full extraction can share it.
+    Captures are saved as UTF-8 whatever the page's own meta charset says.
+    """
+    with open(html_file, 'rb') as f:
+        return BeautifulSoup(f, builder=_LXML_BUILDER, from_encoding='utf-8')
+
+
+def extract_sample_data(soup, limit=3):
     """
     CLAUDE: Always start with this function to test extraction!
     Extract a small sample to validate your selectors and logic.
+    Pass the soup from load_soup(html_file).
     """
     print("🧪 EXTRACTING SAMPLE DATA")
     print("=" * 40)
     
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
-    # TODO: CLAUDE - Customize these selectors based on your page analysis
-    container_selector = "div"  # Change this to your actual container selector
-    containers = soup.select(container_selector)
+    containers = _CONTAINER_MATCHER.select(soup)
     
-    print(f"🔍 Found {len(containers)} containers with selector: {container_selector}")
+    print(f"🔍 Found {len(containers)} containers with selector: {CONTAINER_SELECTOR}")
     
     if len(containers) == 0:
         print("❌ No containers found!")
         print("💡 CLAUDE: You need to:")
         print("   1. Run page_analyzer.py on this HTML file")
-        print("   2. Update the container_selector above")
+        print("   2. Update CONTAINER_SELECTOR at the top of this file")
         print("   3. Test selectors with selector_tester.py")
         return []
     
@@ -101,6 +170,20 @@ def extract_sample_data(html_file, limit=3):
     return sample_data
 
 
+def _first_matching_strings(strings, patterns):
+    """Map each name in patterns to the first of strings matching it"""
+    found = {}
+    for string in strings:
+        if not _ANY_FIELD_RE.search(string):
+            continue
+        for name, pattern in patterns.items():
+            if name not in found and pattern.search(string):
+                found[name] = string
+        if len(found) == len(patterns):
+            break
+    return found
+
+
 def extract_item_from_container(container, index):
     """
     CLAUDE: This is where you extract specific fields from each container.
@@ -110,28 +193,40 @@ def extract_item_from_container(container, index):
     
     # TODO: CLAUDE - Replace these with your actual field extractions
     
-    # Example: Extract ID
     id_elem = container.find(attrs={"data-id": True})  # Adjust selector
+    
+    # Text fields take the first string matching their pattern; look them all
+    # up in one walk over the container instead of one find() per field.
+    # Comments are skipped, as lxml's text() does on the fast paths
+    text_patterns = {'price': _PRICE_RE, 'date': _DATE_RE}
+    if not id_elem:
+        text_patterns['id'] = _ID_TEXT_RE
+    text_matches = _first_matching_strings(
+        (node for node in container.descendants
+         if isinstance(node, NavigableString) and not isinstance(node, Comment)),
+        text_patterns)
+    
+    # Example: Extract ID
     if id_elem:
         item['id'] = id_elem.get('data-id')
     else:
         # Fallback: try other patterns
-        id_text = container.find(string=re.compile(r'ID.*\d+'))
+        id_text = text_matches.get('id')
         if id_text:
-            item['id'] = re.search(r'\d+', id_text).group()
+            item['id'] = _ID_NUM_RE.search(id_text).group()
     
     # Example: Extract title/name
-    title_elem = container.find(['h1', 'h2', 'h3', '.title', '.name'])  # Adjust selector
+    title_elem = _TITLE_MATCHER.select_one(container)
     if title_elem:
         item['title'] = title_elem.get_text().strip()
     
     # Example: Extract price
-    price_elem = container.find(string=re.compile(r'[¥$€£]\d+'))
+    price_elem = text_matches.get('price')
     if price_elem:
         item['price'] = price_elem.strip()
     
     # Example: Extract date
-    date_elem = container.find(string=re.compile(r'\d{4}-\d{2}-\d{2}|\w+ \d+, \d{4}'))
+    date_elem = text_matches.get('date')
     if date_elem:
         item['date'] = date_elem.strip()
     
@@ -152,22 +247,17 @@ def extract_item_from_container(container, index):
         return None
 
 
-def extract_all_data(html_file):
+def extract_all_data(soup):
     """
     CLAUDE: Use this after testing sample extraction.
-    This processes all containers on the page.
+    This processes all containers on the page; pass the same soup
+    that extract_sample_data() used.
     """
     print("🚀 EXTRACTING ALL DATA")
     print("=" * 40)
     
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
     # Use the same selector as in sample extraction
-    container_selector = "div"  # TODO: CLAUDE - update this
-    containers = soup.select(container_selector)
+    containers = _CONTAINER_MATCHER.select(soup)
     
     print(f"🔍 Processing {len(containers)} containers...")
     
@@ -193,6 +283,245 @@ def extract_all_data(html_file):
     return all_data
 
 
+def _extract_container_entry(entry):
+    """
+    Worker for extract_all_data_parallel(): rebuilds one top-level
+    container from its HTML and extracts it and its nested containers.
+    """
+    first_index, html, nested_positions = entry
+    # html.parser keeps fragments such as a lone <tr> as written
+    root = BeautifulSoup(html, builder=_FRAGMENT_BUILDER).find(True)
+    tags = root.find_all(True)
+    
+    items = []
+    item = extract_item_from_container(root, first_index)
+    if item:
+        items.append(item)
+    for offset, position in enumerate(nested_positions, 1):
+        item = extract_item_from_container(tags[position], first_index + offset)
+        if item:
+            items.append(item)
+    return items
+
+
+def extract_all_data_parallel(soup, max_workers=None):
+    """
+    CLAUDE: extract_all_data() spread over several processes, for pages
+    with many containers and a customized extract_item_from_container()
+    that is slow. Containers are matched here with CONTAINER_SELECTOR;
+    only the outermost ones are sent to the workers, together with the
+    positions of the containers nested in them. Returns the same item
+    format, in the same order.
+    """
+    print("🚀 EXTRACTING ALL DATA (parallel)")
+    print("=" * 40)
+    
+    containers = _CONTAINER_MATCHER.select(soup)
+    
+    print(f"🔍 Processing {len(containers)} containers...")
+    
+    # Tags hash by their whole subtree, so track them by identity
+    container_ids = {id(container) for container in containers}
+    covered = set()
+    entries = []
+    for i, container in enumerate(containers):
+        if id(container) in covered:
+            continue
+        nested_positions = []
+        for position, tag in enumerate(container.find_all(True)):
+            if id(tag) in container_ids:
+                nested_positions.append(position)
+                covered.add(id(tag))
+        entries.append((i, str(container), nested_positions))
+    
+    all_data = []
+    processed = 0
+    
+    if len(entries) <= 1:
+        results = map(_extract_container_entry, entries)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+        results = executor.map(_extract_container_entry, entries, chunksize=64)
+    
+    try:
+        for entry, items in zip(entries, results):
+            all_data.extend(items)
+            
+            # Progress indicator
+            before = processed
+            processed += 1 + len(entry[2])
+            if processed // 10 != before // 10:
+                print(f"📊 Processed {processed}/{len(containers)} containers ({len(all_data)} successful)")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    
+    success_count = len(all_data)
+    print("\n✅ Extraction complete!")
+    print(f"📊 Total containers: {len(containers)}")
+    print(f"📦 Successful extractions: {success_count}")
+    print(f"⚠️  Failed extractions: {len(containers) - success_count}")
+    
+    return all_data
+
+
+def extract_item_from_element(element, index):
+    """
+    lxml counterpart of extract_item_from_container() used by
+    extract_all_data_fast(); returns items with the same fields.
+    """
+    item = {}
+    
+    ids = _ID_ATTR_XPATH(element)
+    
+    # Same single walk over the text nodes as extract_item_from_container()
+    text_patterns = {'price': _PRICE_RE, 'date': _DATE_RE}
+    if not ids:
+        text_patterns['id'] = _ID_TEXT_RE
+    text_matches = _first_matching_strings(_TEXT_NODES_XPATH(element), text_patterns)
+    
+    # Example: Extract ID
+    if ids:
+        item['id'] = str(ids[0])
+    else:
+        # Fallback: try other patterns
+        id_text = text_matches.get('id')
+        if id_text:
+            item['id'] = _ID_NUM_RE.search(id_text).group()
+    
+    # Example: Extract title/name
+    title_elem = _TITLE_XPATH(element)
+    if title_elem:
+        item['title'] = _TEXT_XPATH(title_elem[0]).strip()
+    
+    # Example: Extract price
+    price_text = text_matches.get('price')
+    if price_text:
+        item['price'] = price_text.strip()
+    
+    # Example: Extract date
+    date_text = text_matches.get('date')
+    if date_text:
+        item['date'] = date_text.strip()
+    
+    # Example: Extract URL
+    urls = _URL_XPATH(element)
+    if urls:
+        item['url'] = str(urls[0])
+    
+    # Add metadata
+    item['container_index'] = index
+    item['extraction_timestamp'] = datetime.now().isoformat()
+    
+    # Validate: only return if we got some meaningful data
+    required_fields = ['id', 'title']  # TODO: CLAUDE - adjust required fields
+    if any(field in item for field in required_fields):
+        return item
+    else:
+        return None
+
+
+def extract_all_data_fast(html_file):
+    """
+    CLAUDE: Replacement for extract_all_data() on big pages; takes the
+    html_file itself, since it parses with lxml instead of bs4.
+    Walks the tree with compiled lxml XPath instead of bs4, so pages
+    with thousands of containers stay fast. Returns the same item format.
+    """
+    print("🚀 EXTRACTING ALL DATA (lxml)")
+    print("=" * 40)
+    
+    # Captures are saved as UTF-8 whatever the page's own meta charset says
+    parser = lxml.html.HTMLParser(encoding='utf-8', huge_tree=True)
+    tree = lxml.html.parse(html_file, parser=parser)
+    
+    containers = CONTAINER_XPATH(tree)
+    
+    print(f"🔍 Processing {len(containers)} containers...")
+    
+    all_data = []
+    success_count = 0
+    
+    for i, container in enumerate(containers):
+        item = extract_item_from_element(container, i)
+        
+        if item:
+            all_data.append(item)
+            success_count += 1
+        
+        # Progress indicator
+        if (i + 1) % 10 == 0:
+            print(f"📊 Processed {i + 1}/{len(containers)} containers ({success_count} successful)")
+    
+    print("\n✅ Extraction complete!")
+    print(f"📊 Total containers: {len(containers)}")
+    print(f"📦 Successful extractions: {success_count}")
+    print(f"⚠️  Failed extractions: {len(containers) - success_count}")
+    
+    return all_data
+
+
+def extract_all_data_stream(html_file):
+    """
+    CLAUDE: Like extract_all_data_fast(), but for pages too big to hold
+    as one tree. Containers are extracted as soon as they are parsed and
+    then cleared, so memory stays around one top-level container.
+    Returns the same item format, in the same order.
+    """
+    print("🚀 EXTRACTING ALL DATA (streaming)")
+    print("=" * 40)
+    
+    # Captures are saved as UTF-8 whatever the page's own meta charset says
+    context = etree.iterparse(html_file, events=('start', 'end'), tag=CONTAINER_TAG,
+                              html=True, encoding='utf-8', huge_tree=True)
+    
+    all_data = []
+    total = 0
+    success_count = 0
+    # Indexes of the containers currently open, outermost first. Nested
+    # containers are only cleared with their outermost one, so every
+    # container still sees its whole subtree when extracted.
+    open_indexes = []
+    pending = []
+    
+    for event, elem in context:
+        if event == 'start':
+            if is_stream_container(elem):
+                open_indexes.append(total)
+                total += 1
+            continue
+        
+        if not is_stream_container(elem):
+            continue
+        
+        index = open_indexes.pop()
+        item = extract_item_from_element(elem, index)
+        if item:
+            pending.append((index, item))
+            success_count += 1
+        
+        if (index + 1) % 10 == 0:
+            print(f"📊 Processed {index + 1} containers so far")
+        
+        if not open_indexes:
+            # Inner containers end before their parent; restore document order
+            pending.sort(key=lambda entry: entry[0])
+            all_data.extend(item for _, item in pending)
+            pending.clear()
+            
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+    
+    print("\n✅ Extraction complete!")
+    print(f"📊 Total containers: {total}")
+    print(f"📦 Successful extractions: {success_count}")
+    print(f"⚠️  Failed extractions: {total - success_count}")
+    
+    return all_data
+
+
 def save_results(data, output_dir="outputs"):
     """Save extraction results in multiple formats"""
     os.makedirs(output_dir, exist_ok=True)
@@ -201,26 +530,23 @@ def save_results(data, output_dir="outputs"):
     
     # Save as JSON
     json_file = f"{output_dir}/extraction_{timestamp}.json"
-    with open(json_file, 'w', encoding='utf-8') as f:
-        json.dump({
+    with open(json_file, 'wb') as f:
+        f.write(orjson.dumps({
             "extraction_date": datetime.now().isoformat(),
             "total_items": len(data),
             "items": data
-        }, f, indent=2, ensure_ascii=False)
+        }, option=orjson.OPT_INDENT_2))
     
     # Save as CSV
     if data:
         csv_file = f"{output_dir}/extraction_{timestamp}.csv"
-        fieldnames = set()
-        for item in data:
-            fieldnames.update(item.keys())
-        
-        fieldnames = sorted(list(fieldnames))
+        fieldnames = sorted({key for item in data for key in item})
         
         with open(csv_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(data)
+            writer = csv.writer(f)
+            writer.writerow(fieldnames)
+            # Rows are built as they are written; missing fields stay empty
+            writer.writerows([item.get(key, '') for key in fieldnames] for item in data)
         
         print(f"💾 Results saved:")
         print(f"   📄 JSON: {json_file}")
@@ -293,13 +619,16 @@ def main():
         # Find latest HTML file
         html_file = find_latest_html_file()
         
+        # Parse once; the full extraction below reuses the same soup
+        soup = load_soup(html_file)
+        
         # STEP 1: Test sample extraction
-        sample_data = extract_sample_data(html_file, limit=3)
+        sample_data = extract_sample_data(soup, limit=3)
         
         if not sample_data:
             print("\n❌ Sample extraction failed!")
             print("🔧 CLAUDE: You need to customize the extraction logic:")
-            print("   1. Update container_selector in extract_sample_data()")
+            print("   1. Update CONTAINER_SELECTOR at the top of this file")
             print("   2. Customize extract_item_from_container() function")
             print("   3. Test with selector_tester.py if needed")
             return
@@ -316,7 +645,9 @@ def main():
         
         # For automated runs, you can uncomment below to extract all data
         # print("\n🚀 Proceeding with full extraction...")
-        # all_data = extract_all_data(html_file)
+        # all_data = extract_all_data(soup)  # or extract_all_data_fast(html_file) for big pages
+        # # and extract_all_data_stream(html_file) for pages too big to hold in memory;
+        # # extract_all_data_parallel(soup) runs a slow custom extractor on all cores
         # validate_extraction(all_data)
         # save_results(all_data)
         
@@ -22,11 +22,32 @@ CLAUDE: Always validate your extraction results!
 
 import sys
 import os
-import json
+import orjson
 from collections import Counter
 import re
 from datetime import datetime
 
+# Common field patterns checked by check_field_quality(), compiled once
+_FIELD_PATTERNS = {
+    field: (re.compile(pattern, re.I), description)
+    for field, (pattern, description) in {
+        'id': [r'[A-Z0-9-]+', "Should contain alphanumeric characters and dashes"],
+        'order_id': [r'[A-Z0-9-]+', "Should contain alphanumeric characters and dashes"],
+        'price': [r'[¥$€£]?\d+', "Should contain currency symbol and numbers"],
+        'total_amount': [r'[¥$€£]?\d+', "Should contain currency symbol and numbers"],
+        'date': [r'\d{4}', "Should contain a year (4 digits)"],
+        'order_date': [r'\d{4}', "Should contain a year (4 digits)"],
+        'email': [r'@.*\.', "Should contain @ and domain"],
+        'url': [r'https?://', "Should start with http:// or https://"]
+    }.items()
+}
+_NUMBER_RE = re.compile(r'\d+')
+_YEAR_RE = re.compile(r'\d{4}')
+
+# Keys checked for duplicates, and fields whose year range is reported
+_DUPLICATE_KEYS = ['id', 'order_id', 'url', 'title', 'name']
+_DATE_FIELDS = ['date', 'order_date', 'created_at', 'timestamp']
+
 
 def validate_extraction_results(results_file):
     """Comprehensive validation of extraction results"""
@@ -39,9 +60,9 @@ def validate_extraction_results(results_file):
     
     # Load results
     try:
-        with open(results_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except json.JSONDecodeError:
+        with open(results_file, 'rb') as f:
+            data = orjson.loads(f.read())
+    except orjson.JSONDecodeError:
         print(f"❌ Invalid JSON file: {results_file}")
         return False
     
@@ -71,12 +92,7 @@ def validate_extraction_results(results_file):
     print()
     
     # Run validation checks
-    validation_passed = True
-    
-    validation_passed &= check_data_completeness(items)
-    validation_passed &= check_field_quality(items)
-    validation_passed &= check_duplicates(items)
-    validation_passed &= analyze_patterns(items)
+    validation_passed = _run_all_checks(items)
     
     # Final assessment
     print("🎯 VALIDATION SUMMARY")
@@ -91,38 +107,87 @@ def validate_extraction_results(results_file):
     return validation_passed
 
 
-def check_data_completeness(items):
+def _run_all_checks(items):
+    """Walk the items once, collecting what every check needs, then report"""
+    all_fields = set()
+    non_empty_counts = Counter()
+    quality_issues = []
+    # Per key: value -> first position seen, and how often a seen value repeats
+    duplicates = {key: ({}, Counter()) for key in _DUPLICATE_KEYS}
+    numeric_stats = {}  # field -> [min, max, total, count]
+    years = {field: set() for field in _DATE_FIELDS}
+    
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        
+        for field, value in item.items():
+            all_fields.add(field)
+            if value and str(value).strip():
+                non_empty_counts[field] += 1
+            
+            # Numbers, or the first number inside strings (like prices)
+            number = None
+            if isinstance(value, (int, float)):
+                number = value
+            elif isinstance(value, str):
+                number_match = _NUMBER_RE.search(value)
+                if number_match:
+                    number = float(number_match.group())
+            if number is not None:
+                stats = numeric_stats.get(field)
+                if stats is None:
+                    numeric_stats[field] = [number, number, number, 1]
+                else:
+                    if number < stats[0]:
+                        stats[0] = number
+                    if number > stats[1]:
+                        stats[1] = number
+                    stats[2] += number
+                    stats[3] += 1
+        
+        for field, (pattern, description) in _FIELD_PATTERNS.items():
+            if field in item and item[field]:
+                value = str(item[field])
+                if not pattern.search(value):
+                    quality_issues.append(f"⚠️  {field}: '{value}' - {description}")
+                    break  # Only show first few issues per field
+        
+        for key, (seen, repeats) in duplicates.items():
+            if key in item and item[key]:
+                value = str(item[key]).strip().lower()
+                if value in seen:
+                    repeats[value] += 1
+                else:
+                    seen[value] = len(seen)
+        
+        for field, field_years in years.items():
+            if field in item and item[field]:
+                # Try to extract year
+                year_match = _YEAR_RE.search(str(item[field]))
+                if year_match:
+                    field_years.add(int(year_match.group()))
+    
+    validation_passed = True
+    validation_passed &= report_data_completeness(all_fields, non_empty_counts, len(items))
+    validation_passed &= report_field_quality(quality_issues)
+    validation_passed &= report_duplicates(duplicates)
+    validation_passed &= report_patterns(numeric_stats, years)
+    return validation_passed
+
+
+def report_data_completeness(all_fields, non_empty_counts, total_items):
     """Check field completeness across all items"""
     print("📋 DATA COMPLETENESS CHECK")
     print("-" * 30)
     
-    if not items:
-        print("❌ No items to check!")
-        return False
-    
-    # Collect all fields
-    all_fields = set()
-    for item in items:
-        if isinstance(item, dict):
-            all_fields.update(item.keys())
-    
     print(f"📝 Fields found: {', '.join(sorted(all_fields))}")
     
     # Check completeness for each field
     issues = 0
-    total_items = len(items)
     
     for field in sorted(all_fields):
-        count_with_field = 0
-        count_non_empty = 0
-        
-        for item in items:
-            if isinstance(item, dict) and field in item:
-                count_with_field += 1
-                if item[field] and str(item[field]).strip():
-                    count_non_empty += 1
-        
-        presence_rate = (count_with_field / total_items) * 100
+        count_non_empty = non_empty_counts[field]
         completeness_rate = (count_non_empty / total_items) * 100
         
         status = "✅"
@@ -141,37 +206,15 @@ def check_data_completeness(items):
     return issues == 0
 
 
-def check_field_quality(items):
+def report_field_quality(quality_issues):
     """Check quality of specific field types"""
     print("🔍 FIELD QUALITY CHECK")
     print("-" * 30)
     
-    issues = 0
-    
-    # Check common field patterns
-    field_patterns = {
-        'id': [r'[A-Z0-9-]+', "Should contain alphanumeric characters and dashes"],
-        'order_id': [r'[A-Z0-9-]+', "Should contain alphanumeric characters and dashes"],
-        'price': [r'[¥$€£]?\d+', "Should contain currency symbol and numbers"],
-        'total_amount': [r'[¥$€£]?\d+', "Should contain currency symbol and numbers"],
-        'date': [r'\d{4}', "Should contain a year (4 digits)"],
-        'order_date': [r'\d{4}', "Should contain a year (4 digits)"],
-        'email': [r'@.*\.', "Should contain @ and domain"],
-        'url': [r'https?://', "Should start with http:// or https://"]
-    }
-    
-    for item in items:
-        if not isinstance(item, dict):
-            continue
-            
-        for field, (pattern, description) in field_patterns.items():
-            if field in item and item[field]:
-                value = str(item[field])
-                if not re.search(pattern, value, re.I):
-                    print(f"⚠️  {field}: '{value}' - {description}")
-                    issues += 1
-                    break  # Only show first few issues per field
+    for issue in quality_issues:
+        print(issue)
     
+    issues = len(quality_issues)
     if issues == 0:
         print("✅ No field quality issues found")
     else:
@@ -181,33 +224,23 @@ def check_field_quality(items):
     return issues == 0
 
 
-def check_duplicates(items):
+def report_duplicates(duplicates):
     """Check for duplicate items"""
     print("🔍 DUPLICATE CHECK")
     print("-" * 30)
     
-    # Check for duplicates based on different keys
-    duplicate_keys = ['id', 'order_id', 'url', 'title', 'name']
-    
     duplicates_found = 0
     
-    for key in duplicate_keys:
-        values = []
-        for item in items:
-            if isinstance(item, dict) and key in item and item[key]:
-                values.append(str(item[key]).strip().lower())
-        
-        if not values:
+    for key, (seen, repeats) in duplicates.items():
+        if not seen:
             continue
         
-        value_counts = Counter(values)
-        duplicates = {v: count for v, count in value_counts.items() if count > 1}
-        
-        if duplicates:
-            print(f"⚠️  {key}: {len(duplicates)} duplicate values found")
-            for value, count in list(duplicates.items())[:3]:  # Show first 3
-                print(f"     '{value}' appears {count} times")
-            duplicates_found += len(duplicates)
+        if repeats:
+            print(f"⚠️  {key}: {len(repeats)} duplicate values found")
+            # Show first 3, in order of first appearance
+            for value in sorted(repeats, key=seen.get)[:3]:
+                print(f"     '{value}' appears {repeats[value] + 1} times")
+            duplicates_found += len(repeats)
         else:
             print(f"✅ {key}: No duplicates found")
     
@@ -217,60 +250,21 @@ def check_duplicates(items):
     return duplicates_found == 0
 
 
-def analyze_patterns(items):
+def report_patterns(numeric_stats, years):
     """Analyze data patterns and statistics"""
     print("📈 PATTERN ANALYSIS")
     print("-" * 30)
     
     # Analyze numeric fields (prices, quantities, etc.)
-    numeric_fields = []
-    for item in items:
-        if isinstance(item, dict):
-            for key, value in item.items():
-                if isinstance(value, (int, float)):
-                    numeric_fields.append(key)
-                elif isinstance(value, str):
-                    # Check if string contains numbers (like prices)
-                    if re.search(r'\d+', value):
-                        numeric_fields.append(key)
-    
-    numeric_fields = list(set(numeric_fields))
-    
-    if numeric_fields:
+    if numeric_stats:
         print("📊 Numeric field analysis:")
-        for field in numeric_fields:
-            values = []
-            for item in items:
-                if isinstance(item, dict) and field in item:
-                    value = item[field]
-                    if isinstance(value, (int, float)):
-                        values.append(value)
-                    elif isinstance(value, str):
-                        # Extract numbers from strings
-                        numbers = re.findall(r'\d+', value)
-                        if numbers:
-                            try:
-                                values.append(float(numbers[0]))
-                            except ValueError:
-                                pass
-            
-            if values:
-                print(f"  {field}: min={min(values)}, max={max(values)}, avg={sum(values)/len(values):.1f}")
+        for field, (minimum, maximum, total, count) in numeric_stats.items():
+            print(f"  {field}: min={minimum}, max={maximum}, avg={total/count:.1f}")
     
     # Check date ranges
-    date_fields = ['date', 'order_date', 'created_at', 'timestamp']
-    for field in date_fields:
-        dates = []
-        for item in items:
-            if isinstance(item, dict) and field in item and item[field]:
-                date_str = str(item[field])
-                # Try to extract year
-                year_match = re.search(r'\d{4}', date_str)
-                if year_match:
-                    dates.append(int(year_match.group()))
-        
-        if dates:
-            print(f"📅 {field}: {min(dates)} to {max(dates)} ({len(set(dates))} unique years)")
+    for field, field_years in years.items():
+        if field_years:
+            print(f"📅 {field}: {min(field_years)} to {max(field_years)} ({len(field_years)} unique years)")
     
     print()
     return True
@@ -22,12 +22,78 @@ CLAUDE: This tool helps you understand what you're working with!
 
 import sys
 import os
+import io
+import heapq
+import datetime
+import hashlib
+from contextlib import redirect_stdout
 from pathlib import Path
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+import soupsieve as sv
 import re
-import json
+import orjson
 from collections import Counter
 
+# Reports are cached per page content, so re-analyzing an unchanged capture
+# while iterating on selectors skips the parse and every scan
+_CACHE_DIR = os.path.join('.', 'tmp', '.page_analyzer_cache')
+
+
+def _pattern_family(patterns):
+    """Compile a pattern family: each pattern on its own, plus their union"""
+    compiled = tuple(re.compile(pattern, re.I) for pattern in patterns)
+    union = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns), re.I)
+    return union, compiled
+
+
+# Price patterns
+_PRICE_PATTERNS = _pattern_family([
+    r'[¥$€£]\s*[\d,]+\.?\d*',
+    r'[\d,]+\.?\d*\s*[¥$€£]',
+    r'price.*[\d,]+',
+    r'cost.*[\d,]+',
+    r'total.*[\d,]+'
+])
+
+# Date patterns
+_DATE_PATTERNS = _pattern_family([
+    r'\d{4}-\d{2}-\d{2}',
+    r'\d{1,2}/\d{1,2}/\d{4}',
+    r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',
+    r'\d{4}年\d{1,2}月\d{1,2}日'
+])
+
+# ID patterns
+_ID_PATTERNS = _pattern_family([
+    r'id[:\s]*[A-Z0-9-]+',
+    r'order[:\s]*[A-Z0-9-]+',
+    r'#[A-Z0-9-]+',
+    r'[A-Z0-9]{3}-[A-Z0-9]{7}-[A-Z0-9]{7}'  # Amazon-style IDs
+])
+
+# Container class patterns: tags whose classes are checked, and the keywords
+_CONTAINER_CLASS_TAGS = frozenset(['div', 'section', 'article'])
+_CONTAINER_KEYWORDS = ('item', 'order', 'product', 'card', 'box', 'row', 'entry')
+_CONTAINER_RE = re.compile('|'.join(_CONTAINER_KEYWORDS), re.I)
+
+# Container scoring: candidate tags, the children that make them look like
+# data, and the string types get_text() collects inside them
+_CANDIDATE_TAGS = frozenset(['div', 'section', 'article', 'li'])
+_MEANINGFUL_CHILD_TAGS = frozenset(['a', 'span', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img'])
+_TEXT_STRING_TYPES = frozenset([NavigableString, CData])
+
+# Field selector suggestions, compiled once
+_FIELD_SELECTORS = {
+    label: (selector, sv.compile(selector))
+    for label, selector in {
+        'Links (products/details)': 'a[href*="product"], a[href*="/dp/"], a[href*="item"]',
+        'Prices': '[class*="price"], [data-price], .amount, .cost',
+        'Dates': '[class*="date"], [datetime], .timestamp',
+        'IDs/Numbers': '[data-id], [data-order], .order-id, .item-id',
+        'Titles': 'h1, h2, h3, .title, .name, .product-name'
+    }.items()
+}
+
 
 def analyze_page(html_file):
     """Analyze page structure and provide insights for Claude"""
@@ -40,47 +106,199 @@ def analyze_page(html_file):
         show_recent_captures()
         return
     
-    # Load and parse HTML
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
+    # Load HTML
+    with open(html_file, 'rb') as f:
+        html_bytes = f.read()
     
-    soup = BeautifulSoup(html_content, 'html.parser')
+    cache_path = _analysis_cache_path(html_bytes)
+    analysis = _load_cached_analysis(cache_path)
     
-    # Basic page info
-    title = soup.find('title')
-    page_title = title.get_text().strip() if title else "No title"
+    if analysis is None:
+        analysis = run_analysis(html_bytes)
+        _save_cached_analysis(cache_path, analysis)
+        cache_note = None
+    else:
+        cache_note = "♻️  Unchanged since last analysis, showing cached report"
     
-    print(f"📄 Page: {page_title}")
+    print(f"📄 Page: {analysis['title']}")
     print(f"📁 File: {html_file}")
+    if cache_note:
+        print(cache_note)
     print()
     
-    # Structure analysis
-    analyze_structure(soup)
-    
-    # Pattern detection
-    analyze_patterns(soup)
-    
-    # Suggest containers
-    suggest_containers(soup)
+    # Structure, patterns and container suggestions
+    sys.stdout.write(analysis['report'])
     
     # Show next steps for Claude
     show_claude_next_steps(html_file)
 
 
-def analyze_structure(soup):
+def run_analysis(html_bytes):
+    """Parse the page and return its title and the printed analysis report"""
+    # lxml decodes the bytes itself; captures are saved as UTF-8 whatever
+    # the page's own meta charset says
+    soup = BeautifulSoup(html_bytes, 'lxml', from_encoding='utf-8')
+    
+    # Basic page info
+    title = soup.find('title')
+    page_title = title.get_text().strip() if title else "No title"
+    
+    # Everything the report needs from the tree, gathered in one walk
+    page_stats = collect_page_stats(soup)
+    
+    report = io.StringIO()
+    with redirect_stdout(report):
+        # Structure analysis
+        analyze_structure(page_stats)
+        
+        # Pattern detection
+        analyze_patterns(page_stats)
+        
+        # Suggest containers
+        suggest_containers(soup, page_stats)
+    
+    return {'title': page_title, 'report': report.getvalue()}
+
+
+def _analysis_cache_path(html_bytes):
+    """Cache file for a page; the key also covers this script, so editing it invalidates old reports"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    digest.update(html_bytes)
+    return os.path.join(_CACHE_DIR, f"{digest.hexdigest()}.json")
+
+
+def _load_cached_analysis(cache_path):
+    """Return the cached analysis, or None if there is no usable entry"""
+    try:
+        with open(cache_path, 'rb') as f:
+            analysis = orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    if not isinstance(analysis, dict) or not {'title', 'report'} <= analysis.keys():
+        return None
+    return analysis
+
+
+def _save_cached_analysis(cache_path, analysis):
+    """Write the analysis atomically; caching is best effort"""
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(analysis))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+
+def collect_page_stats(soup):
+    """
+    Walk the tree once and gather what analyze_structure(), analyze_patterns()
+    and suggest_containers() report:
+
+    - tag_counts / input_buttons: tag totals for the structure overview
+    - indicators: price, date and ID pattern matches over the page strings
+    - container_classes: container-like class names on div/section/article
+    - candidates: (elem, meaningful children, stripped text length) for every
+      div/section/article/li, in document order
+
+    Each open tag accumulates [children, text length, leading whitespace,
+    trailing whitespace] and folds them into its parent when it closes, so
+    nested candidates don't re-walk their subtrees.
+    """
+    tag_counts = Counter()
+    input_buttons = 0
+    # Each indicator counts, per pattern, the strings it matches; only try
+    # single patterns where their family's union matched
+    families = (_PRICE_PATTERNS, _DATE_PATTERNS, _ID_PATTERNS)
+    indicators = [0] * len(families)
+    container_classes = Counter()
+    candidates = []
+    stack = [(soup, [0, 0, 0, 0])]
+    
+    def close_top():
+        elem, (children, length, lead, trail) = stack.pop()
+        parent = stack[-1][1]
+        parent[0] += children + (elem.name in _MEANINGFUL_CHILD_TAGS)
+        _append_text(parent, length, lead, trail)
+    
+    for node in soup.descendants:
+        while stack[-1][0] is not node.parent:
+            close_top()
+        
+        if isinstance(node, Tag):
+            name = node.name
+            tag_counts[name] += 1
+            if name == 'input' and node.get('type', '').lower() == 'button':
+                input_buttons += 1
+            
+            classes = node.get('class')
+            if classes and name in _CONTAINER_CLASS_TAGS:
+                for cls in classes:
+                    if _CONTAINER_RE.search(cls):
+                        container_classes[cls] += 1
+            
+            totals = [0, 0, 0, 0]
+            stack.append((node, totals))
+            if name in _CANDIDATE_TAGS:
+                candidates.append((node, totals))
+            continue
+        
+        for i, (union, patterns) in enumerate(families):
+            if union.search(node):
+                indicators[i] += sum(1 for pattern in patterns if pattern.search(node))
+        
+        if type(node) in _TEXT_STRING_TYPES:
+            length = len(node)
+            lead = length - len(node.lstrip())
+            trail = length - len(node.rstrip()) if lead < length else length
+            _append_text(stack[-1][1], length, lead, trail)
+    
+    while len(stack) > 1:
+        close_top()
+    
+    return {
+        'tag_counts': tag_counts,
+        'input_buttons': input_buttons,
+        'indicators': dict(zip(('price', 'date', 'id'), indicators)),
+        'container_classes': container_classes,
+        'candidates': [
+            (elem, children, max(length - lead - trail, 0))
+            for elem, (children, length, lead, trail) in candidates
+        ],
+    }
+
+
+def _append_text(totals, length, lead, trail):
+    """Extend totals' text by a segment, tracking whitespace at both ends for strip()"""
+    if totals[2] == totals[1]:  # Everything so far is whitespace
+        totals[2] += lead
+    totals[3] = trail if trail < length else totals[3] + length
+    totals[1] += length
+
+
+def analyze_structure(page_stats):
     """Analyze basic page structure"""
     print("📊 PAGE STRUCTURE")
     print("-" * 30)
     
+    tag_counts = page_stats['tag_counts']
+    input_buttons = page_stats['input_buttons']
+    
     stats = {
-        'Total elements': len(soup.find_all()),
-        'Divs': len(soup.find_all('div')),
-        'Links': len(soup.find_all('a')),
-        'Images': len(soup.find_all('img')),
-        'Forms': len(soup.find_all('form')),
-        'Tables': len(soup.find_all('table')),
-        'Lists': len(soup.find_all(['ul', 'ol'])),
-        'Buttons': len(soup.find_all(['button', 'input[type="button"]']))
+        'Total elements': sum(tag_counts.values()),
+        'Divs': tag_counts['div'],
+        'Links': tag_counts['a'],
+        'Images': tag_counts['img'],
+        'Forms': tag_counts['form'],
+        'Tables': tag_counts['table'],
+        'Lists': tag_counts['ul'] + tag_counts['ol'],
+        'Buttons': tag_counts['button'] + input_buttons
     }
     
     for key, value in stats.items():
@@ -89,68 +307,18 @@ def analyze_structure(soup):
     print()
 
 
-def analyze_patterns(soup):
+def analyze_patterns(page_stats):
     """Detect common data patterns"""
     print("🎯 DETECTED PATTERNS")
     print("-" * 30)
     
-    # Price patterns
-    price_patterns = [
-        r'[¥$€£]\s*[\d,]+\.?\d*',
-        r'[\d,]+\.?\d*\s*[¥$€£]',
-        r'price.*[\d,]+',
-        r'cost.*[\d,]+',
-        r'total.*[\d,]+'
-    ]
-    
-    prices_found = 0
-    for pattern in price_patterns:
-        matches = soup.find_all(string=re.compile(pattern, re.I))
-        prices_found += len(matches)
-    
-    print(f"  💰 Price indicators: {prices_found}")
-    
-    # Date patterns
-    date_patterns = [
-        r'\d{4}-\d{2}-\d{2}',
-        r'\d{1,2}/\d{1,2}/\d{4}',
-        r'(January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}',
-        r'\d{4}年\d{1,2}月\d{1,2}日'
-    ]
-    
-    dates_found = 0
-    for pattern in date_patterns:
-        matches = soup.find_all(string=re.compile(pattern, re.I))
-        dates_found += len(matches)
-    
-    print(f"  📅 Date indicators: {dates_found}")
-    
-    # ID patterns
-    id_patterns = [
-        r'id[:\s]*[A-Z0-9-]+',
-        r'order[:\s]*[A-Z0-9-]+',
-        r'#[A-Z0-9-]+',
-        r'[A-Z0-9]{3}-[A-Z0-9]{7}-[A-Z0-9]{7}'  # Amazon-style IDs
-    ]
-    
-    ids_found = 0
-    for pattern in id_patterns:
-        matches = soup.find_all(string=re.compile(pattern, re.I))
-        ids_found += len(matches)
-    
-    print(f"  🆔 ID indicators: {ids_found}")
+    indicators = page_stats['indicators']
+    print(f"  💰 Price indicators: {indicators['price']}")
+    print(f"  📅 Date indicators: {indicators['date']}")
+    print(f"  🆔 ID indicators: {indicators['id']}")
     
     # Container patterns
-    container_keywords = ['item', 'order', 'product', 'card', 'box', 'row', 'entry']
-    container_classes = []
-    
-    for elem in soup.find_all(['div', 'section', 'article']):
-        classes = elem.get('class', [])
-        for cls in classes:
-            if any(keyword in cls.lower() for keyword in container_keywords):
-                container_classes.append(cls)
-    
-    container_counter = Counter(container_classes)
+    container_counter = page_stats['container_classes']
     print(f"  📦 Container patterns: {len(container_counter)}")
     
     if container_counter:
@@ -161,7 +329,7 @@ def analyze_patterns(soup):
     print()
 
 
-def suggest_containers(soup):
+def suggest_containers(soup, page_stats):
     """Suggest likely data containers for extraction"""
     print("💡 SUGGESTED SELECTORS")
     print("-" * 30)
@@ -169,14 +337,10 @@ def suggest_containers(soup):
     # Find containers with multiple child elements (likely data containers)
     potential_containers = []
     
-    for elem in soup.find_all(['div', 'section', 'article', 'li']):
-        # Count meaningful children
-        children = elem.find_all(['a', 'span', 'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'img'])
-        text_length = len(elem.get_text().strip())
-        
+    for elem, children_count, text_length in page_stats['candidates']:
         # Score container
         score = 0
-        if len(children) >= 3:  # Multiple elements
+        if children_count >= 3:  # Multiple elements
             score += 2
         if 50 <= text_length <= 1000:  # Reasonable amount of text
             score += 1
@@ -195,17 +359,17 @@ def suggest_containers(soup):
                 'element': elem.name,
                 'classes': elem.get('class', []),
                 'id': elem.get('id'),
-                'children_count': len(children),
+                'children_count': children_count,
                 'text_length': text_length,
                 'score': score
             }
             potential_containers.append(container_info)
     
-    # Sort by score and show top suggestions
-    potential_containers.sort(key=lambda x: x['score'], reverse=True)
+    # Show top suggestions by score; ties keep document order, as with a stable sort
+    top_containers = heapq.nlargest(5, potential_containers, key=lambda x: x['score'])
     
     print("  🎯 Top container candidates:")
-    for i, container in enumerate(potential_containers[:5]):
+    for i, container in enumerate(top_containers):
         classes_str = '.'.join(container['classes']) if container['classes'] else 'no-class'
         id_str = f"#{container['id']}" if container['id'] else ''
         
@@ -222,53 +386,47 @@ def suggest_containers(soup):
     print("\n  🔍 Field selector suggestions:")
     
     # Look for common patterns
-    selectors = {
-        'Links (products/details)': 'a[href*="product"], a[href*="/dp/"], a[href*="item"]',
-        'Prices': '[class*="price"], [data-price], .amount, .cost',
-        'Dates': '[class*="date"], [datetime], .timestamp',
-        'IDs/Numbers': '[data-id], [data-order], .order-id, .item-id',
-        'Titles': 'h1, h2, h3, .title, .name, .product-name'
-    }
-    
-    for label, selector in selectors.items():
-        elements = soup.select(selector)
+    for label, (selector, matcher) in _FIELD_SELECTORS.items():
+        elements = matcher.select(soup)
         print(f"    {label}: {selector} ({len(elements)} found)")
     
     print()
 
 
+def _scan_html_files(directory, prefix="", recursive=False):
+    """
+    Yield (path, mtime) for prefix*.html files in directory, using the stat
+    data os.scandir() already has; with recursive=True, subdirectories too.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith("."):
+                    continue
+                if recursive and entry.is_dir(follow_symlinks=False):
+                    yield from _scan_html_files(entry.path, prefix, recursive)
+                elif name.startswith(prefix) and name.endswith(".html") and entry.is_file():
+                    yield entry.path, entry.stat().st_mtime
+    except FileNotFoundError:
+        pass
+
+
 def show_recent_captures():
     """Show recent capture files to help Claude"""
-    tmp_files = []
-    sessions_files = []
-    
-    # Check tmp directory
-    if os.path.exists('./tmp'):
-        tmp_files = [f for f in os.listdir('./tmp') if f.startswith('page_') and f.endswith('.html')]
-        tmp_files.sort()
-    
-    # Check sessions directory
-    if os.path.exists('./sessions'):
-        for session_dir in os.listdir('./sessions'):
-            session_path = os.path.join('./sessions', session_dir)
-            if os.path.isdir(session_path):
-                session_files = [f for f in os.listdir(session_path) if f.endswith('.html')]
-                for f in session_files:
-                    sessions_files.append(os.path.join(session_path, f))
+    # Check tmp directory; page numbers are zero-padded, so names sort by capture
+    tmp_files = sorted(_scan_html_files('./tmp', prefix='page_'))
+    
+    # Check sessions directory; captures live in sessions/<session>/<site>/
+    sessions_files = sorted(_scan_html_files('./sessions', recursive=True),
+                            key=lambda file: file[1])
     
     print("Recent HTML files:")
-    all_files = []
-    for f in tmp_files[-5:]:  # Last 5 from tmp
-        all_files.append(f"./tmp/{f}")
-    for f in sessions_files[-5:]:  # Last 5 from sessions
-        all_files.append(f)
-    
-    for f in all_files:
-        if os.path.exists(f):
-            mtime = os.path.getmtime(f)
-            import datetime
-            time_str = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
-            print(f"  {f} ({time_str})")
+    all_files = tmp_files[-5:] + sessions_files[-5:]  # Last 5 from each
+    
+    for f, mtime in all_files:
+        time_str = datetime.datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M')
+        print(f"  {f} ({time_str})")
 
 
 def show_claude_next_steps(html_file):
@@ -21,6 +21,8 @@ CLAUDE: Use this to validate selectors before extraction!
 
 import sys
 import os
+import io
+from contextlib import redirect_stdout
 from bs4 import BeautifulSoup
 import re
 
@@ -34,11 +36,10 @@ def test_selector_interactive(html_file):
         print(f"❌ File not found: {html_file}")
         return
     
-    # Load HTML
-    with open(html_file, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, 'html.parser')
+    # Load HTML; lxml decodes the bytes itself, and captures are saved as
+    # UTF-8 whatever the page's own meta charset says
+    with open(html_file, 'rb') as f:
+        soup = BeautifulSoup(f.read(), 'lxml', from_encoding='utf-8')
     
     print(f"📄 Testing selectors on: {html_file}")
     print("💡 Enter CSS selectors to test (or 'help' for examples)")
@@ -89,8 +90,12 @@ def test_selector_interactive(html_file):
             if not selector:
                 continue
             
-            # Test the selector
-            test_selector(soup, selector)
+            # Test the selector; its report is written in one go
+            report = io.StringIO()
+            with redirect_stdout(report):
+                test_selector(soup, selector)
+            sys.stdout.write(report.getvalue())
+            sys.stdout.flush()
             
         except KeyboardInterrupt:
             print("\n👋 Goodbye!")
@@ -102,8 +107,12 @@ def test_selector_interactive(html_file):
 def test_selector(soup, selector):
     """Test a single selector and show results"""
     try:
-        elements = soup.select(selector)
+        # Only three matches are shown, so only those are kept; the rest
+        # are just counted, and only if there can be more than three
+        elements = soup.select(selector, limit=3)
         count = len(elements)
+        if count == 3:
+            count = sum(1 for _ in soup.css.iselect(selector))
         
         print(f"✅ Selector: {selector}")
         print(f"📊 Found: {count} elements")